@@ -11,10 +11,12 @@
 # limitations under the License.
 
 import datetime
+import re
 
 import pretend
 import pytest
 
+from pydantic import StrictStr
 from pyramid.httpexceptions import HTTPMethodNotAllowed
 from pyramid_rpc.xmlrpc import XmlRpcApplicationError
 
@@ -37,30 +39,35 @@ class TestRateLimiting:
         def view(context, request):
             return None
 
-        ratelimited_view = xmlrpc.ratelimit()(view)
+        ratelimited_view = xmlrpc.submit_metrics_and_ratelimit("some_method")(view)
         context = pretend.stub()
         pyramid_request.remote_addr = "127.0.0.1"
         fake_rate_limiter = pretend.stub(
-            test=lambda *a: True, hit=lambda *a: True, resets_in=lambda *a: None
+            hit=pretend.call_recorder(lambda *a: True), resets_in=lambda *a: None
         )
         pyramid_services.register_service(
             fake_rate_limiter, IRateLimiter, None, name="xmlrpc.client"
         )
         ratelimited_view(context, pyramid_request)
 
+        assert fake_rate_limiter.hit.calls == [pretend.call("127.0.0.1")]
         assert metrics.increment.calls == [
-            pretend.call("warehouse.xmlrpc.ratelimiter.hit", tags=[])
+            pretend.call("warehouse.xmlrpc.call", tags=["rpc_method:some_method"]),
+            pretend.call("warehouse.xmlrpc.ratelimiter.hit", tags=[]),
+        ]
+        assert metrics.timed.calls == [
+            pretend.call("warehouse.xmlrpc.timing", tags=["rpc_method:some_method"])
         ]
 
     def test_ratelimiting_block(self, pyramid_services, pyramid_request, metrics):
         def view(context, request):
             return None
 
-        ratelimited_view = xmlrpc.ratelimit()(view)
+        ratelimited_view = xmlrpc.submit_metrics_and_ratelimit("some_method")(view)
         context = pretend.stub()
         pyramid_request.remote_addr = "127.0.0.1"
         fake_rate_limiter = pretend.stub(
-            test=lambda *a: False, hit=lambda *a: True, resets_in=lambda *a: None
+            hit=lambda *a: False, resets_in=lambda *a: None
         )
         pyramid_services.register_service(
             fake_rate_limiter, IRateLimiter, None, name="xmlrpc.client"
@@ -74,7 +81,8 @@ class TestRateLimiting:
         )
 
         assert metrics.increment.calls == [
-            pretend.call("warehouse.xmlrpc.ratelimiter.exceeded", tags=[])
+            pretend.call("warehouse.xmlrpc.call", tags=["rpc_method:some_method"]),
+            pretend.call("warehouse.xmlrpc.ratelimiter.exceeded", tags=[]),
         ]
 
     @pytest.mark.parametrize(
@@ -90,13 +98,11 @@ class TestRateLimiting:
         def view(context, request):
             return None
 
-        ratelimited_view = xmlrpc.ratelimit()(view)
+        ratelimited_view = xmlrpc.submit_metrics_and_ratelimit("some_method")(view)
         context = pretend.stub()
         pyramid_request.remote_addr = "127.0.0.1"
         fake_rate_limiter = pretend.stub(
-            test=lambda *a: False,
-            hit=lambda *a: True,
-            resets_in=lambda *a: resets_in_delta,
+            hit=lambda *a: False, resets_in=lambda *a: resets_in_delta
         )
         pyramid_services.register_service(
             fake_rate_limiter, IRateLimiter, None, name="xmlrpc.client"
@@ -111,10 +117,40 @@ class TestRateLimiting:
         )
 
         assert metrics.increment.calls == [
-            pretend.call("warehouse.xmlrpc.ratelimiter.exceeded", tags=[])
+            pretend.call("warehouse.xmlrpc.call", tags=["rpc_method:some_method"]),
+            pretend.call("warehouse.xmlrpc.ratelimiter.exceeded", tags=[]),
         ]
 
 
+class TestTypedMapplyViewMapper:
+    def test_reuses_validated_view(self, monkeypatch):
+        def view(request, name: StrictStr):
+            return (request, name)
+
+        validate_call = pretend.call_recorder(lambda fn: fn)
+        monkeypatch.setattr(xmlrpc, "validate_call", validate_call)
+        monkeypatch.setattr(xmlrpc.TypedMapplyViewMapper, "_validated_views", {})
+        request = pretend.stub()
+        mapper = xmlrpc.TypedMapplyViewMapper()
+
+        assert mapper.mapply(view, (request, "one"), {}) == (request, "one")
+        assert mapper.mapply(view, (request, "two"), {}) == (request, "two")
+        assert validate_call.calls == [pretend.call(view)]
+
+    def test_invalid_params(self):
+        def view(request, name: StrictStr):
+            return name
+
+        mapper = xmlrpc.TypedMapplyViewMapper()
+
+        with pytest.raises(xmlrpc.XMLRPCInvalidParamTypes) as exc:
+            mapper.mapply(view, (pretend.stub(), 1), {})
+
+        assert exc.value.faultString == (
+            "client error; name: Input should be a valid string"
+        )
+
+
 class TestSearch:
     @pytest.mark.parametrize("domain", [None, "example.com"])
     def test_error(self, pyramid_request, metrics, monkeypatch, domain):
@@ -255,6 +291,49 @@ def test_package_releases_hidden(db_request):
     ]
 
 
+def test_package_releases_skips_yanked_and_prereleases(db_request):
+    project = ProjectFactory.create()
+    ReleaseFactory.create(project=project, version="1.0", _pypi_ordering=1)
+    ReleaseFactory.create(project=project, version="2.0", _pypi_ordering=2, yanked=True)
+    ReleaseFactory.create(
+        project=project, version="3.0a1", _pypi_ordering=3, is_prerelease=True
+    )
+
+    assert xmlrpc.package_releases(db_request, project.name) == ["1.0"]
+    assert xmlrpc.package_releases(db_request, project.name, show_hidden=True) == [
+        "3.0a1",
+        "2.0",
+        "1.0",
+    ]
+
+
+def test_package_releases_only_prereleases(db_request):
+    project = ProjectFactory.create()
+    ReleaseFactory.create(
+        project=project, version="1.0a1", _pypi_ordering=1, is_prerelease=True
+    )
+    ReleaseFactory.create(
+        project=project, version="1.0a2", _pypi_ordering=2, is_prerelease=True
+    )
+
+    assert xmlrpc.package_releases(db_request, project.name) == ["1.0a2"]
+
+
+def test_package_releases_unnormalized_name(db_request):
+    project = ProjectFactory.create(name="foo-bar")
+    release = ReleaseFactory.create(project=project)
+    result = xmlrpc.package_releases(db_request, "Foo_.Bar")
+    assert result == [release.version]
+
+
+def test_canonicalize_name_only_caches_short_names():
+    xmlrpc._canonicalize_short_name.cache_clear()
+
+    assert xmlrpc._canonicalize_name("Foo_.Bar") == "foo-bar"
+    assert xmlrpc._canonicalize_name("F" * 101) == "f" * 101
+    assert xmlrpc._canonicalize_short_name.cache_info().currsize == 1
+
+
 def test_package_releases_no_project(db_request):
     result = xmlrpc.package_releases(db_request, "foo")
     assert result == []
@@ -277,7 +356,13 @@ def test_release_data_no_release(db_request):
 
 def test_release_data(db_request):
     project = ProjectFactory.create()
-    release = ReleaseFactory.create(project=project)
+    release = ReleaseFactory.create(
+        project=project,
+        project_urls={
+            "Source": "https://example.com/source",
+            "Bug\x1bTracker": "https://example.com/issues",
+        },
+    )
 
     urls = [pretend.stub(), pretend.stub()]
     urls_iter = iter(urls)
@@ -293,7 +378,10 @@ def test_release_data(db_request):
         "docs_url": release.project.documentation_url,
         "home_page": release.home_page,
         "download_url": release.download_url,
-        "project_url": list(release.project_urls),
+        "project_url": [
+            "BugTracker, https://example.com/issues",
+            "Source, https://example.com/source",
+        ],
         "author": release.author,
         "author_email": release.author_email,
         "maintainer": release.maintainer,
@@ -329,13 +417,13 @@ def test_release_urls(db_request):
     release = ReleaseFactory.create(project=project)
     file_ = FileFactory.create(
         release=release,
-        filename=f"{project.name}-{release.version}.tar.gz",
+        filename=f"{project.name}-{release.version} (copy).tar.gz",
         python_version="source",
     )
 
-    urls = [pretend.stub()]
-    urls_iter = iter(urls)
-    db_request.route_url = pretend.call_recorder(lambda r, **kw: next(urls_iter))
+    db_request.route_url = pretend.call_recorder(
+        lambda r, **kw: f"https://files.example.com/packages/{kw['path']}?x=y"
+    )
 
     assert xmlrpc.release_urls(db_request, project.name, release.version) == [
         {
@@ -352,11 +440,51 @@ def test_release_urls(db_request):
             "comment_text": file_.comment_text,
             "downloads": -1,
             "path": file_.path,
-            "url": urls[0],
+            "url": (
+                "https://files.example.com/packages/"
+                + file_.path.replace(" ", "%20")
+                + "?x=y"
+            ),
         }
     ]
     assert db_request.route_url.calls == [
-        pretend.call("packaging.file", path=file_.path)
+        pretend.call("packaging.file", path=xmlrpc._file_path_placeholder)
+    ]
+
+
+def test_release_urls_many_files(db_request):
+    project = ProjectFactory.create()
+    release = ReleaseFactory.create(project=project)
+    files = FileFactory.create_batch(3, release=release, packagetype="bdist_wheel")
+
+    db_request.route_url = pretend.call_recorder(
+        lambda r, **kw: f"https://files.example.com/packages/{kw['path']}"
+    )
+
+    result = xmlrpc.release_urls(db_request, project.name, release.version)
+
+    assert {r["url"] for r in result} == {
+        f"https://files.example.com/packages/{f.path}" for f in files
+    }
+    assert len(db_request.route_url.calls) == 1
+
+
+@pytest.mark.parametrize(
+    "files_url",
+    ["https://files.example.com/packages/{path}", "/packages/{path}"],
+)
+def test_release_urls_match_route_url(db_request, pyramid_config, files_url):
+    pyramid_config.add_route("packaging.file", files_url)
+    project = ProjectFactory.create()
+    release = ReleaseFactory.create(project=project)
+    file_ = FileFactory.create(
+        release=release, filename="an odd #file+name!% ünïcode.tar.gz"
+    )
+
+    result = xmlrpc.release_urls(db_request, project.name, release.version)
+
+    assert [r["url"] for r in result] == [
+        db_request.route_url("packaging.file", path=file_.path)
     ]
 
 
@@ -477,6 +605,13 @@ def test_browse(db_request):
             ],
         )
     ) == {(expected_release.project.name, expected_release.version)}
+    assert (
+        xmlrpc.browse(
+            db_request,
+            ["Environment :: Other Environment", "Environment :: Does Not Exist"],
+        )
+        == []
+    )
 
 
 def test_multicall(pyramid_request):
@@ -490,12 +625,32 @@ def test_multicall(pyramid_request):
 
 
 @pytest.mark.parametrize(
-    "string, expected", [("Hello…", "Hello&#8230;"), ("Stripe\x1b", "Stripe")]
+    "string, expected",
+    [
+        ("Hello…", "Hello&#8230;"),
+        ("Stripe\x1b", "Stripe"),
+        ("\x00Tab\tand\r\nnewline\x7f", "Tab\tand\r\nnewline"),
+        ("Non\ufffeCharacter", "Non&#65534;Character"),
+        ("", ""),
+        (None, None),
+    ],
 )
 def test_clean_for_xml(string, expected):
     assert xmlrpc._clean_for_xml(string) == expected
 
 
+@pytest.mark.parametrize("char", [chr(c) for c in range(0x80)])
+def test_clean_for_xml_ascii(char):
+    illegal = re.compile("[%s]" % "".join(xmlrpc._illegal_ranges))
+    expected = "" if illegal.match(char) else char
+    assert xmlrpc._clean_for_xml(f"a{char}") == f"a{expected}"
+
+
+def test_clean_for_xml_returns_clean_strings_unchanged():
+    string = "A perfectly ordinary summary."
+    assert xmlrpc._clean_for_xml(string) is string
+
+
 def test_http_method_not_allowed_does_not_bubble_up(pyramid_request):
     assert isinstance(
         xmlrpc.exception_view(HTTPMethodNotAllowed(), pyramid_request),
@@ -0,0 +1,93 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import xmlrpc.client as xmlrpc_client
+
+import pretend
+import pytest
+
+from warehouse.utils.xmlrpc import XMLRPCRenderer
+
+
+class Thing:
+    def __init__(self):
+        self.name = "thing"
+        self.count = 3
+
+
+class TestXMLRPCRenderer:
+    @pytest.mark.parametrize(
+        "value",
+        [
+            "a <string> & more",
+            12,
+            None,
+            ["one", 2, True, None, 1.5, ("nested", ["lists"])],
+            {"one": "<1>", "two": 2, "three": False, "four": {"five": [5]}},
+            [("name", "1.0", 1700000000, "new release", 1)],
+            [Thing()],
+            {"thing": Thing()},
+            xmlrpc_client.Fault(-32500, "RuntimeError: Oops"),
+        ],
+    )
+    def test_matches_standard_library(self, value):
+        renderer = XMLRPCRenderer(allow_none=True)(pretend.stub())
+
+        expected = xmlrpc_client.dumps(
+            value if isinstance(value, xmlrpc_client.Fault) else (value,),
+            methodresponse=True,
+            allow_none=True,
+        )
+        assert renderer(value, {}) == expected
+
+    def test_sets_content_type(self, pyramid_request):
+        renderer = XMLRPCRenderer(allow_none=True)(pretend.stub())
+
+        renderer([], {"request": pyramid_request})
+
+        assert pyramid_request.response.content_type == "text/xml"
+
+    def test_keeps_explicit_content_type(self, pyramid_request):
+        renderer = XMLRPCRenderer(allow_none=True)(pretend.stub())
+        pyramid_request.response.content_type = "application/xml"
+
+        renderer([], {"request": pyramid_request})
+
+        assert pyramid_request.response.content_type == "application/xml"
+
+    @pytest.mark.parametrize(
+        "value, exc",
+        [
+            ({1: "one"}, TypeError),
+            (["none", None], TypeError),
+            ([2**31], OverflowError),
+            ([object()], TypeError),
+            ({"str": type("StrSubclass", (str,), {})("s")}, TypeError),
+        ],
+    )
+    def test_unmarshallable(self, value, exc):
+        renderer = XMLRPCRenderer()(pretend.stub())
+
+        with pytest.raises(exc):
+            renderer(value, {})
+
+    def test_recursive(self):
+        renderer = XMLRPCRenderer()(pretend.stub())
+        recursive_list = []
+        recursive_list.append(recursive_list)
+        recursive_dict = {}
+        recursive_dict["self"] = recursive_dict
+
+        with pytest.raises(TypeError, match="cannot marshal recursive sequences"):
+            renderer(recursive_list, {})
+        with pytest.raises(TypeError, match="cannot marshal recursive dictionaries"):
+            renderer(recursive_dict, {})
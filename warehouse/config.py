@@ -27,11 +27,11 @@ from pyramid.authorization import Allow, Authenticated
 from pyramid.config import Configurator as _Configurator
 from pyramid.response import Response
 from pyramid.tweens import EXCVIEW
-from pyramid_rpc.xmlrpc import XMLRPCRenderer
 
 from warehouse.errors import BasicAuthBreachedPassword, BasicAuthFailedPassword
 from warehouse.utils.static import ManifestCacheBuster
 from warehouse.utils.wsgi import ProxyFixer, VhmRootRemover
+from warehouse.utils.xmlrpc import XMLRPCRenderer
 
 
 class Environment(str, enum.Enum):
@@ -592,8 +592,8 @@ def configure(settings=None):
     # Register our XMLRPC cache
     config.include(".legacy.api.xmlrpc.cache")
 
-    # Register support for XMLRPC and override it's renderer to allow
-    # specifying custom dumps arguments.
+    # Register support for XMLRPC and override it's renderer with our own, which
+    # allows None and marshals large responses faster.
     config.include("pyramid_rpc.xmlrpc")
     config.add_renderer("xmlrpc", XMLRPCRenderer(allow_none=True))
 
@@ -12,7 +12,6 @@
 
 import datetime
 import functools
-import re
 import xmlrpc.client
 import xmlrpc.server
 
@@ -22,6 +21,7 @@ from inspect import signature
 from packaging.utils import canonicalize_name
 from pydantic import StrictBool, StrictInt, StrictStr, ValidationError, validate_call
 from pyramid.httpexceptions import HTTPMethodNotAllowed, HTTPTooManyRequests
+from pyramid.traversal import PATH_SAFE, quote_path_segment
 from pyramid.view import view_config
 from pyramid_rpc.mapper import MapplyViewMapper
 from pyramid_rpc.xmlrpc import (
@@ -43,6 +43,7 @@ from warehouse.packaging.models import (
     Project,
     Release,
     ReleaseClassifiers,
+    ReleaseURL,
     Role,
 )
 from warehouse.rate_limiting import IRateLimiter
@@ -73,66 +74,95 @@ _illegal_ranges = [
     "\U000ffffe-\U000fffff",
     "\U0010fffe-\U0010ffff",
 ]
-_illegal_xml_chars_re = re.compile("[%s]" % "".join(_illegal_ranges))
+# After encoding with xmlcharrefreplace only ASCII remains, so the only illegal
+# characters that can survive are the ones below 0x80.
+_illegal_xml_bytes = bytes(
+    c for r in _illegal_ranges for c in range(ord(r[0]), min(ord(r[-1]), 0x7F) + 1)
+)
+
+# Journal entries store submitted_date as a naive UTC datetime, so the unix
+# timestamp is simply the number of whole seconds since this naive epoch.
+_epoch = datetime.datetime(1970, 1, 1)
+_one_second = datetime.timedelta(seconds=1)
+
+# The same handful of popular project names are looked up over and over, so
+# remember their canonical forms rather than normalizing them on every call.
+_canonicalize_short_name = functools.lru_cache(maxsize=2**12)(canonicalize_name)
+
+
+def _canonicalize_name(name):
+    # Names come straight from the request, so only remember ones that are short
+    # enough to plausibly be real project names, to keep the cache's size bounded.
+    if len(name) > 100:
+        return canonicalize_name(name)
+    return _canonicalize_short_name(name)
+
+
+# A path segment that Pyramid leaves untouched when generating a URL, used to
+# find where a file's path belongs in the URL generated for packaging.file.
+_file_path_placeholder = "__file_path__"
 
 XMLRPC_DEPRECATION_URL = (
     "https://warehouse.pypa.io/api-reference/xml-rpc.html#deprecated-methods"
 )
 
+# Messages for the removed and deprecated methods which never change, so that
+# they don't have to be formatted again for every call.
+_api_removed_message = (
+    "This API has been removed. Use BigQuery instead. "
+    f"See {XMLRPC_DEPRECATION_URL} for more information."
+)
+_api_deprecated_message = (
+    f"This API has been deprecated. See {XMLRPC_DEPRECATION_URL} for more "
+    "information."
+)
+
 
 def _clean_for_xml(data):
     """Sanitize any user-submitted data to ensure that it can be used in XML"""
 
     # If data is None or an empty string, don't bother
     if data:
+        # Most fields are plain, printable ASCII already, so skip the copies
+        if data.isascii() and data.isprintable():
+            return data
         # This turns a string like "Hello…" into "Hello&#8230;"
-        data = data.encode("ascii", "xmlcharrefreplace").decode("ascii")
+        data = data.encode("ascii", "xmlcharrefreplace")
         # However it's still possible that there are invalid characters in the string,
         # so simply remove any of those characters
-        return _illegal_xml_chars_re.sub("", data)
+        return data.translate(None, _illegal_xml_bytes).decode("ascii")
     return data
 
 
-def submit_xmlrpc_metrics(method=None):
+def submit_metrics_and_ratelimit(method):
     """
-    Submit metrics.
+    Submit metrics for, and rate limit, calls to an XML-RPC method.
     """
+    tags = [f"rpc_method:{method}"]
 
     def decorator(f):
         def wrapped(context, request):
             metrics = request.find_service(IMetricsService, context=None)
-            metrics.increment("warehouse.xmlrpc.call", tags=[f"rpc_method:{method}"])
-            with metrics.timed(
-                "warehouse.xmlrpc.timing", tags=[f"rpc_method:{method}"]
-            ):
-                return f(context, request)
-
-        return wrapped
-
-    return decorator
-
-
-def ratelimit():
-    def decorator(f):
-        def wrapped(context, request):
-            ratelimiter = request.find_service(
-                IRateLimiter, name="xmlrpc.client", context=None
-            )
-            metrics = request.find_service(IMetricsService, context=None)
-            ratelimiter.hit(request.remote_addr)
-            if not ratelimiter.test(request.remote_addr):
-                metrics.increment("warehouse.xmlrpc.ratelimiter.exceeded", tags=[])
-                message = (
-                    "The action could not be performed because there were too "
-                    "many requests by the client."
+            metrics.increment("warehouse.xmlrpc.call", tags=tags)
+            with metrics.timed("warehouse.xmlrpc.timing", tags=tags):
+                ratelimiter = request.find_service(
+                    IRateLimiter, name="xmlrpc.client", context=None
                 )
-                _resets_in = ratelimiter.resets_in(request.remote_addr)
-                if _resets_in is not None:
-                    _resets_in = max(1, int(_resets_in.total_seconds()))
-                    message += f" Limit may reset in {_resets_in} seconds."
-                raise XMLRPCWrappedError(HTTPTooManyRequests(message))
-            metrics.increment("warehouse.xmlrpc.ratelimiter.hit", tags=[])
-            return f(context, request)
+                # Registering the hit also tells us whether it was allowed, so there
+                # is no need for a separate round trip to test the limit.
+                if not ratelimiter.hit(request.remote_addr):
+                    metrics.increment("warehouse.xmlrpc.ratelimiter.exceeded", tags=[])
+                    message = (
+                        "The action could not be performed because there were too "
+                        "many requests by the client."
+                    )
+                    _resets_in = ratelimiter.resets_in(request.remote_addr)
+                    if _resets_in is not None:
+                        _resets_in = max(1, int(_resets_in.total_seconds()))
+                        message += f" Limit may reset in {_resets_in} seconds."
+                    raise XMLRPCWrappedError(HTTPTooManyRequests(message))
+                metrics.increment("warehouse.xmlrpc.ratelimiter.hit", tags=[])
+                return f(context, request)
 
         return wrapped
 
@@ -148,7 +178,7 @@ def xmlrpc_method(**kwargs):
     kwargs.update(
         require_csrf=False,
         require_methods=["POST"],
-        decorator=(submit_xmlrpc_metrics(method=kwargs["method"]), ratelimit()),
+        decorator=submit_metrics_and_ratelimit(kwargs["method"]),
         mapper=TypedMapplyViewMapper,
     )
 
@@ -167,7 +197,7 @@ xmlrpc_cache_by_project = functools.partial(
     xmlrpc_cache_expires=48 * 60 * 60,  # 48 hours
     xmlrpc_cache_tag="project/%s",
     xmlrpc_cache_arg_index=0,
-    xmlrpc_cache_tag_processor=canonicalize_name,
+    xmlrpc_cache_tag_processor=_canonicalize_name,
 )
 
 
@@ -212,9 +242,17 @@ class XMLRPCWrappedError(xmlrpc.client.Fault):
 
 
 class TypedMapplyViewMapper(MapplyViewMapper):
+    # Building the validating wrapper means building a pydantic model from the
+    # signature of the view, which is the same for every request, so build it
+    # once per view and reuse it.
+    _validated_views: dict = {}
+
     def mapply(self, fn, args, kwargs):
         try:
-            validate_call(fn)(*args, **kwargs)
+            validated = self._validated_views.get(fn)
+            if validated is None:
+                validated = self._validated_views.setdefault(fn, validate_call(fn))
+            return validated(*args, **kwargs)
         except ValidationError as exc:
             raise XMLRPCInvalidParamTypes(
                 "; ".join(
@@ -232,8 +270,6 @@ class TypedMapplyViewMapper(MapplyViewMapper):
                 )
             )
 
-        return super().mapply(fn, args, kwargs)
-
 
 @view_config(route_name="xmlrpc.pypi", context=Exception, renderer="xmlrpc")
 def exception_view(exc, request):
@@ -260,14 +296,14 @@ def search(
 
 @xmlrpc_cache_all_projects(method="list_packages")
 def list_packages(request):
-    names = request.db.query(Project.name).all()
-    return [n[0] for n in names]
+    return request.db.scalars(select(Project.name)).all()
 
 
 @xmlrpc_cache_all_projects(method="list_packages_with_serial")
 def list_packages_with_serial(request):
-    serials = request.db.query(Project.name, Project.last_serial).all()
-    return {serial[0]: serial[1] for serial in serials}
+    # Result has a keys() method, so dict() would treat it as a mapping. Hand it a
+    # plain iterator instead so that each row is consumed as a key/value pair.
+    return dict(iter(request.db.execute(select(Project.name, Project.last_serial))))
 
 
 @xmlrpc_method(method="package_hosting_mode")
@@ -277,59 +313,51 @@ def package_hosting_mode(request, package_name: StrictStr):
 
 @xmlrpc_method(method="user_packages")
 def user_packages(request, username: StrictStr):
-    roles = (
-        request.db.query(Role)
+    roles = request.db.execute(
+        select(Role.role_name, Project.name)
         .join(User)
         .join(Project)
-        .filter(User.username == username)
+        .where(User.username == username)
         .order_by(Role.role_name.desc(), Project.name)
-        .all()
     )
-    return [(r.role_name, r.project.name) for r in roles]
+    return [(role_name, project_name) for role_name, project_name in roles]
 
 
 @xmlrpc_method(method="top_packages")
 def top_packages(request, num: StrictInt | None = None):
-    raise XMLRPCWrappedError(
-        RuntimeError(
-            "This API has been removed. Use BigQuery instead. "
-            f"See {XMLRPC_DEPRECATION_URL} for more information."
-        )
-    )
+    raise XMLRPCWrappedError(RuntimeError(_api_removed_message))
 
 
 @xmlrpc_cache_by_project(method="package_releases")
 def package_releases(request, package_name: StrictStr, show_hidden: StrictBool = False):
-    try:
-        project = (
-            request.db.query(Project)
-            .filter(Project.normalized_name == func.normalize_pep426_name(package_name))
-            .one()
-        )
-    except NoResultFound:
-        return []
+    # Select just the versions, rather than loading the Project and then going
+    # through Project.all_versions or Project.latest_version. A project that
+    # doesn't exist simply has no versions.
+    versions = (
+        select(Release.version)
+        .join(Project)
+        .where(Project.normalized_name == _canonicalize_name(package_name))
+    )
 
     # This used to support the show_hidden parameter to determine if it should
     # show hidden releases or not. However, Warehouse doesn't support the
     # concept of hidden releases, so this parameter controls if the latest
-    # version or all_versions are returned.
+    # version or all versions are returned.
     if show_hidden:
-        return [v.version for v in project.all_versions]
+        versions = versions.order_by(Release._pypi_ordering.desc())
     else:
-        latest_version = project.latest_version
-        if latest_version is None:
-            return []
-        return [latest_version.version]
+        versions = (
+            versions.where(Release.yanked.is_(False))
+            .order_by(Release.is_prerelease.nullslast(), Release._pypi_ordering.desc())
+            .limit(1)
+        )
+
+    return request.db.scalars(versions).all()
 
 
 @xmlrpc_method(method="package_data")
 def package_data(request, package_name, version):
-    raise XMLRPCWrappedError(
-        RuntimeError(
-            "This API has been deprecated. "
-            f"See {XMLRPC_DEPRECATION_URL} for more information."
-        )
-    )
+    raise XMLRPCWrappedError(RuntimeError(_api_deprecated_message))
 
 
 @xmlrpc_cache_by_project(method="release_data")
@@ -340,7 +368,7 @@ def release_data(request, package_name: StrictStr, version: StrictStr):
             .options(orm.joinedload(Release.description))
             .join(Project)
             .filter(
-                (Project.normalized_name == func.normalize_pep426_name(package_name))
+                (Project.normalized_name == _canonicalize_name(package_name))
                 & (Release.version == version)
             )
             .one()
@@ -348,6 +376,14 @@ def release_data(request, package_name: StrictStr, version: StrictStr):
     except NoResultFound:
         return {}
 
+    # Have the database format the "label, url" pairs, rather than loading a
+    # ReleaseURL object for each of them just to format them here.
+    project_urls = request.db.scalars(
+        select(ReleaseURL.name + ", " + ReleaseURL.url)
+        .where(ReleaseURL.release_id == release.id)
+        .order_by(ReleaseURL.name)
+    )
+
     return {
         "name": release.project.name,
         "version": release.version,
@@ -362,10 +398,7 @@ def release_data(request, package_name: StrictStr, version: StrictStr):
         "docs_url": _clean_for_xml(release.project.documentation_url),
         "home_page": _clean_for_xml(release.home_page),
         "download_url": _clean_for_xml(release.download_url),
-        "project_url": [
-            _clean_for_xml(f"{label}, {url}")
-            for label, url in release.project_urls.items()
-        ],
+        "project_url": [_clean_for_xml(project_url) for project_url in project_urls],
         "author": _clean_for_xml(release.author),
         "author_email": _clean_for_xml(release.author_email),
         "maintainer": _clean_for_xml(release.maintainer),
@@ -394,27 +427,37 @@ def release_data(request, package_name: StrictStr, version: StrictStr):
 
 @xmlrpc_method(method="package_urls")
 def package_urls(request, package_name, version):
-    raise XMLRPCWrappedError(
-        RuntimeError(
-            "This API has been deprecated. "
-            f"See {XMLRPC_DEPRECATION_URL} for more information."
-        )
-    )
+    raise XMLRPCWrappedError(RuntimeError(_api_deprecated_message))
 
 
 @xmlrpc_cache_by_project(method="release_urls")
 def release_urls(request, package_name: StrictStr, version: StrictStr):
-    files = (
-        request.db.query(File)
+    files = request.db.execute(
+        select(
+            File.filename,
+            File.packagetype,
+            File.python_version,
+            File.size,
+            File.md5_digest,
+            File.sha256_digest,
+            File.upload_time,
+            File.comment_text,
+            File.path,
+        )
         .join(Release)
         .join(Project)
-        .filter(
-            (Project.normalized_name == func.normalize_pep426_name(package_name))
+        .where(
+            (Project.normalized_name == _canonicalize_name(package_name))
             & (Release.version == version)
         )
-        .all()
     )
 
+    # Every file URL comes from the same route, so generate it just once and
+    # splice each path into it, quoted the same way Pyramid would quote it.
+    url_prefix, _, url_suffix = request.route_url(
+        "packaging.file", path=_file_path_placeholder
+    ).partition(_file_path_placeholder)
+
     return [
         {
             "filename": f.filename,
@@ -434,7 +477,7 @@ def release_urls(request, package_name: StrictStr, version: StrictStr):
             #       here to consider it no longer in use.
             "downloads": -1,
             "path": f.path,
-            "url": request.route_url("packaging.file", path=f.path),
+            "url": url_prefix + quote_path_segment(f.path, safe=PATH_SAFE) + url_suffix,
         }
         for f in files
     ]
@@ -442,15 +485,14 @@ def release_urls(request, package_name: StrictStr, version: StrictStr):
 
 @xmlrpc_cache_by_project(method="package_roles")
 def package_roles(request, package_name: StrictStr):
-    roles = (
-        request.db.query(Role)
+    roles = request.db.execute(
+        select(Role.role_name, User.username)
         .join(User)
         .join(Project)
-        .filter(Project.normalized_name == func.normalize_pep426_name(package_name))
+        .where(Project.normalized_name == _canonicalize_name(package_name))
         .order_by(Role.role_name.desc(), User.username)
-        .all()
     )
-    return [(r.role_name, r.user.username) for r in roles]
+    return [(role_name, username) for role_name, username in roles]
 
 
 @xmlrpc_method(method="changelog_last_serial")
@@ -460,22 +502,32 @@ def changelog_last_serial(request):
 
 @xmlrpc_method(method="changelog_since_serial")
 def changelog_since_serial(request, serial: StrictInt):
-    entries = (
-        request.db.query(JournalEntry)
-        .filter(JournalEntry.id > serial)
+    # Only the columns we return are selected, and rows are streamed from a
+    # server side cursor, so that up to 50,000 entries never have to be held
+    # as ORM objects all at once.
+    entries = request.db.execute(
+        select(
+            JournalEntry.name,
+            JournalEntry.version,
+            JournalEntry.submitted_date,
+            JournalEntry.action,
+            JournalEntry.id,
+        )
+        .where(JournalEntry.id > serial)
         .order_by(JournalEntry.id)
         .limit(50000)
+        .execution_options(yield_per=1000)
     )
 
     return [
         (
-            e.name,
-            e.version,
-            int(e.submitted_date.replace(tzinfo=datetime.UTC).timestamp()),
-            _clean_for_xml(e.action),
-            e.id,
+            name,
+            version,
+            (submitted - _epoch) // _one_second,
+            _clean_for_xml(action),
+            id_,
         )
-        for e in entries
+        for name, version, submitted, action, id_ in entries
     ]
 
 
@@ -491,26 +543,25 @@ def changelog(request, since: StrictInt, with_ids: StrictBool = False):
 
 @xmlrpc_method(method="browse")
 def browse(request, classifiers: list[StrictStr]):
-    classifiers_q = (
-        request.db.query(Classifier)
-        .filter(Classifier.classifier.in_(classifiers))
-        .subquery()
-    )
-
-    release_classifiers_q = (
-        select(ReleaseClassifiers)
-        .where(ReleaseClassifiers.trove_id == classifiers_q.c.id)
-        .alias("rc")
+    # Find the releases that have every requested classifier by counting the
+    # matching rows for each release in release_classifiers on its own, so that
+    # only the releases which qualify are joined to their projects.
+    release_ids = (
+        select(ReleaseClassifiers.release_id)
+        .where(
+            ReleaseClassifiers.trove_id.in_(
+                select(Classifier.id).where(Classifier.classifier.in_(classifiers))
+            )
+        )
+        .group_by(ReleaseClassifiers.release_id)
+        .having(func.count() == len(classifiers))
     )
 
-    releases = (
-        request.db.query(Project.name, Release.version)
+    releases = request.db.execute(
+        select(Project.name, Release.version)
         .join(Release)
-        .join(release_classifiers_q, Release.id == release_classifiers_q.c.release_id)
-        .group_by(Project.name, Release.version)
-        .having(func.count() == len(classifiers))
+        .where(Release.id.in_(release_ids))
         .order_by(Project.name, Release.version)
-        .all()
     )
 
     return [(r.name, r.version) for r in releases]
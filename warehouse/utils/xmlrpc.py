@@ -0,0 +1,121 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import xmlrpc.client
+
+
+class XMLRPCMarshaller(xmlrpc.client.Marshaller):
+    """
+    A Marshaller that produces exactly the same output as the standard library's,
+    but which writes the string and integer members of lists and dicts inline,
+    instead of dispatching on the type of every single one of them. Responses
+    like list_packages_with_serial contain hundreds of thousands of those.
+    """
+
+    dispatch: dict = dict(xmlrpc.client.Marshaller.dispatch)
+
+    def _dump(self, value, write):
+        try:
+            f = self.dispatch[type(value)]
+        except KeyError:
+            # Like the standard library, marshal arbitrary instances as a struct of
+            # their attributes, but refuse subclasses of the types we know about.
+            if not hasattr(value, "__dict__"):
+                raise TypeError(f"cannot marshal {type(value)} objects")
+            for type_ in type(value).__mro__:
+                if type_ in self.dispatch:
+                    raise TypeError(f"cannot marshal {type_} objects")
+            f = self.dispatch["_arbitrary_instance"]
+        f(self, value, write)
+
+    def dump_array(self, value, write):
+        i = id(value)
+        if i in self.memo:
+            raise TypeError("cannot marshal recursive sequences")
+        self.memo[i] = None
+        escape = xmlrpc.client.escape
+        write("<value><array><data>\n")
+        for v in value:
+            if type(v) is str:
+                write(f"<value><string>{escape(v)}</string></value>\n")
+            elif type(v) is int and xmlrpc.client.MININT <= v <= xmlrpc.client.MAXINT:
+                write(f"<value><int>{v}</int></value>\n")
+            else:
+                self._dump(v, write)
+        write("</data></array></value>\n")
+        del self.memo[i]
+
+    dispatch[tuple] = dump_array
+    dispatch[list] = dump_array
+
+    def dump_struct(self, value, write):
+        i = id(value)
+        if i in self.memo:
+            raise TypeError("cannot marshal recursive dictionaries")
+        self.memo[i] = None
+        escape = xmlrpc.client.escape
+        write("<value><struct>\n")
+        for k, v in value.items():
+            if not isinstance(k, str):
+                raise TypeError("dictionary key must be string")
+            if type(v) is str:
+                write(
+                    f"<member>\n<name>{escape(k)}</name>\n"
+                    f"<value><string>{escape(v)}</string></value>\n</member>\n"
+                )
+            elif type(v) is int and xmlrpc.client.MININT <= v <= xmlrpc.client.MAXINT:
+                write(
+                    f"<member>\n<name>{escape(k)}</name>\n"
+                    f"<value><int>{v}</int></value>\n</member>\n"
+                )
+            else:
+                write(f"<member>\n<name>{escape(k)}</name>\n")
+                self._dump(v, write)
+                write("</member>\n")
+        write("</struct></value>\n")
+        del self.memo[i]
+
+    dispatch[dict] = dump_struct
+
+
+class XMLRPCRenderer:
+    """
+    Renders XML-RPC responses like pyramid_rpc's XMLRPCRenderer does, but using
+    the XMLRPCMarshaller.
+    """
+
+    def __init__(self, *, allow_none=False):
+        self.allow_none = allow_none
+
+    def __call__(self, info):
+        def _render(value, system):
+            request = system.get("request")
+            if request is not None:
+                response = request.response
+                if response.content_type == response.default_content_type:
+                    response.content_type = "text/xml"
+
+            if isinstance(value, xmlrpc.client.Fault):
+                return xmlrpc.client.dumps(
+                    value, methodresponse=True, allow_none=self.allow_none
+                )
+
+            marshaller = XMLRPCMarshaller(allow_none=self.allow_none)
+            return "".join(
+                [
+                    "<?xml version='1.0'?>\n<methodResponse>\n",
+                    marshaller.dumps((value,)),
+                    "</methodResponse>\n",
+                ]
+            )
+
+        return _render